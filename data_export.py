@@ -1,15 +1,41 @@
 import os
+import json
 import time
+import hashlib
 import requests
 import pandas as pd
 from datetime import datetime, timedelta
-from site_config import merrimack_sites
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from site_config import sites
 from time_series_analysis import (
-    calculate_kayakability_score,
-    forecast_conditions,
+    calculate_kayakability_score_vec,
+    forecast_all_sites,
     find_optimal_windows,
 )
 
+# orjson parses the large USGS payloads several times faster than the stdlib
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
+# Shared HTTP session so every USGS request reuses a kept-alive connection,
+# retrying transient server errors with backoff before giving up
+SESSION = requests.Session()
+SESSION.headers.update({
+    'User-Agent': 'KayakabilityDashboard/1.0 (github.com/tjnolan319/kayakability-dashboard)'
+})
+SESSION.mount('https://waterservices.usgs.gov', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504])
+))
+
+# Last-good API responses, served when fresh or when the API is unreachable
+CACHE_DIR = '.cache'
+USGS_CACHE_TTL = 5 * 60  # seconds
+
 def ensure_data_folders():
     """Create necessary data folders if they don't exist"""
     folders = [
@@ -55,38 +81,116 @@ def initialize_csv_files():
         else:
             print(f"📋 CSV exists: {file_path}")
 
+def write_file_atomic(path, content):
+    """Write bytes via a temp file so readers never see a partial file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def read_json(path):
+    """Load a JSON file with the fastest available parser"""
+    with open(path, 'rb') as f:
+        return json_loads(f.read())
+
+def cached_get_json(url, ttl):
+    """
+    GET a JSON document, keeping the last good response on disk.
+    A cached copy younger than ttl seconds is returned without a request.
+    Older copies are revalidated with If-None-Match/If-Modified-Since, and
+    if the request fails the cached copy is served as a stale fallback.
+    """
+    cache_key = hashlib.sha1(url.encode()).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
+    meta_path = os.path.join(CACHE_DIR, f"{cache_key}.meta")
+    has_cache = os.path.exists(cache_path)
+
+    if has_cache and time.time() - os.path.getmtime(cache_path) < ttl:
+        return read_json(cache_path)
+
+    # Conditional GET using the validators saved with the cached body
+    headers = {}
+    if has_cache and os.path.exists(meta_path):
+        meta = read_json(meta_path)
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    try:
+        response = SESSION.get(url, headers=headers, timeout=30)
+        if response.status_code == 304 and has_cache:
+            # Unchanged upstream: restart the TTL and reuse the cached body
+            os.utime(cache_path)
+            return read_json(cache_path)
+        response.raise_for_status()
+        data = json_loads(response.content)
+    except Exception as e:
+        if not has_cache:
+            raise
+        print(f"⚠️  Request failed ({e}), using cached response {cache_path}")
+        return read_json(cache_path)
+
+    # Cache the raw body as received; no need to re-serialize what was parsed
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    write_file_atomic(cache_path, response.content)
+    write_file_atomic(meta_path, json.dumps({
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }).encode())
+
+    return data
+
 def fetch_hourly_usgs_data(site_id, days_back=7):
     """
     Fetch hourly USGS data for the given site ID and number of days back.
     Returns a DataFrame with columns: datetime, discharge_cfs, gage_height_ft
     """
-    # Calculate start time in epoch (seconds)
-    end_time = pd.Timestamp.utcnow()
-    start_time = end_time - pd.Timedelta(days=days_back)
+    return fetch_all_hourly_usgs_data([site_id], days_back=days_back)[site_id]
 
+def fetch_all_hourly_usgs_data(site_ids, days_back=7):
+    """
+    Fetch hourly USGS data for several sites with a single request.
+    Returns a dict mapping each site ID to a DataFrame as returned by
+    fetch_hourly_usgs_data (empty if the site had no usable data).
+    """
+    # A relative period (rather than startDT/endDT) keeps the URL identical
+    # between runs, so cached responses can be revalidated with a conditional GET
     url = (
         f"https://waterservices.usgs.gov/nwis/iv/"
-        f"?format=json&sites={site_id}"
+        f"?format=json&sites={','.join(site_ids)}"
         f"&parameterCd=00060,00065"
-        f"&startDT={start_time.strftime('%Y-%m-%dT%H:%M:%S')}"
-        f"&endDT={end_time.strftime('%Y-%m-%dT%H:%M:%S')}"
+        f"&period=P{days_back}D"
         f"&siteStatus=all"
     )
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = cached_get_json(url, ttl=USGS_CACHE_TTL)
     except Exception as e:
-        print(f"Error fetching data for site {site_id}: {e}")
-        return pd.DataFrame()
+        print(f"Error fetching data for sites {', '.join(site_ids)}: {e}")
+        return {site_id: pd.DataFrame() for site_id in site_ids}
 
+    # Dispatch the returned series to the site they belong to
+    series_by_site = {site_id: [] for site_id in site_ids}
     try:
-        # Parse JSON into DataFrame
-        time_series = data['value']['timeSeries']
-        # Create empty lists to hold parsed data
-        records = []
+        for series in data['value']['timeSeries']:
+            site_code = series['sourceInfo']['siteCode'][0]['value']
+            series_by_site.setdefault(site_code, []).append(series)
+    except Exception as e:
+        print(f"Error parsing data for sites {', '.join(site_ids)}: {e}")
+        return {site_id: pd.DataFrame() for site_id in site_ids}
 
+    return {
+        site_id: parse_usgs_time_series(site_id, series_by_site[site_id])
+        for site_id in site_ids
+    }
+
+def parse_usgs_time_series(site_id, time_series):
+    """
+    Parse the USGS timeSeries entries for one site into a DataFrame with
+    columns: datetime, discharge_cfs, gage_height_ft
+    """
+    try:
         # Extract discharge (00060) and gage height (00065) series
         discharge_series = None
         gage_series = None
@@ -114,32 +218,38 @@ def fetch_hourly_usgs_data(site_id, days_back=7):
         }
 
         # Combine by datetime (intersection)
-        common_times = set(discharge_data.keys()) & set(gage_data.keys())
-        for dt in sorted(common_times):
-            records.append({
-                'datetime': pd.to_datetime(dt),
-                'discharge_cfs': discharge_data[dt],
-                'gage_height_ft': gage_data[dt]
-            })
-
-        df = pd.DataFrame(records)
+        common_times = sorted(set(discharge_data) & set(gage_data))
+        if not common_times:
+            return pd.DataFrame()
+
+        # Parse all timestamps in one call; a window spanning a DST change
+        # mixes UTC offsets, which needs per-value parsing as before
+        try:
+            datetimes = pd.to_datetime(common_times)
+        except ValueError:
+            datetimes = [pd.to_datetime(dt) for dt in common_times]
+
+        df = pd.DataFrame({
+            'datetime': datetimes,
+            'discharge_cfs': [discharge_data[dt] for dt in common_times],
+            'gage_height_ft': [gage_data[dt] for dt in common_times]
+        })
         return df
 
     except Exception as e:
         print(f"Error parsing data for site {site_id}: {e}")
         return pd.DataFrame()
 
-def fetch_weather_data(site_id, site_info):
+def fetch_weather_data(site, run_time):
     """
-    Fetch weather data for the site location
+    Fetch weather data for the site location, stamped with the shared run time
     This is a placeholder - you'll need to integrate with a weather API
     """
     # Placeholder weather data - replace with actual weather API call
-    current_time = pd.Timestamp.utcnow()
     weather_data = {
-        'datetime': current_time,
-        'site_id': site_id,
-        'site_name': site_info['name'],
+        'datetime': run_time,
+        'site_id': site.site_id,
+        'site_name': site.name,
         'temperature_f': 70.0,  # Replace with actual API call
         'humidity_percent': 50.0,
         'wind_speed_mph': 5.0,
@@ -260,7 +370,7 @@ def cleanup_old_data(days_to_keep=30):
     """
     Remove data older than specified days to prevent CSV files from growing too large
     """
-    cutoff_date = pd.Timestamp.utcnow() - pd.Timedelta(days=days_to_keep)
+    cutoff_date = pd.Timestamp.now('UTC') - pd.Timedelta(days=days_to_keep)
     
     csv_files = [
         'kayak_forecast_data/river_data/historical_hourly_data.csv',
@@ -282,6 +392,8 @@ def cleanup_old_data(days_to_keep=30):
 
 def main():
     print("🚀 Starting Enhanced Kayak Forecasting System...")
+    # One timestamp for the whole run, shared by every site's records
+    run_time = pd.Timestamp.now('UTC')
     print(f"⏰ Run time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     # Ensure folder structure exists
@@ -300,12 +412,16 @@ def main():
     all_optimal_windows = []
     all_weather_data = []
 
-    for site_id, site_info in merrimack_sites.items():
-        print(f"\n🔍 Processing site: {site_info['name']}")
+    # Fetch historical hourly data (7 days) for all sites in one request
+    print("📈 Fetching historical data for all sites...")
+    historical_by_site = fetch_all_hourly_usgs_data([site.site_id for site in sites], days_back=7)
+
+    forecast_jobs = []
+    for site in sites:
+        site_id = site.site_id
+        print(f"\n🔍 Processing site: {site.name}")
 
-        # Fetch historical hourly data (7 days)
-        print("  📈 Fetching historical data...")
-        historical_df = fetch_hourly_usgs_data(site_id, days_back=7)
+        historical_df = historical_by_site[site_id]
 
         if historical_df.empty:
             print(f"  ⚠️  No historical data available for {site_id}")
@@ -313,19 +429,18 @@ def main():
 
         # Add site info and kayakability scores
         historical_df['site_id'] = site_id
-        historical_df['site_name'] = site_info['name']
-        historical_df['kayakability_score'] = historical_df.apply(
-            lambda row: calculate_kayakability_score(
-                row['discharge_cfs'], row['gage_height_ft'],
-                site_info['ideal_discharge_range'], site_info['ideal_gage_range']
-            ), axis=1
+        historical_df['site_name'] = site.name
+        historical_df['kayakability_score'] = calculate_kayakability_score_vec(
+            historical_df['discharge_cfs'].to_numpy(),
+            historical_df['gage_height_ft'].to_numpy(),
+            site.ideal_discharge_range, site.ideal_gage_range
         )
 
         all_historical_data.append(historical_df)
 
         # Fetch weather data
         print("  🌤️  Fetching weather data...")
-        weather_df = fetch_weather_data(site_id, site_info)
+        weather_df = fetch_weather_data(site, run_time)
         if not weather_df.empty:
             all_weather_data.append(weather_df)
 
@@ -333,11 +448,13 @@ def main():
         site_folder = "kayak_forecast_data"
         csv_path = os.path.join(site_folder, f"{site_id}_historical.csv")
         historical_df.to_csv(csv_path, index=False)
+        forecast_jobs.append((site, csv_path))
 
-        # Generate forecast (pass CSV path now)
-        print("  🔮 Generating 10-day forecast...")
-        forecast_df = forecast_conditions(site_id, site_info, csv_path)
+    # Generate forecasts (sites are independent, so they run concurrently)
+    print("\n🔮 Generating 10-day forecasts...")
+    forecasts = forecast_all_sites(forecast_jobs)
 
+    for (site, _), forecast_df in zip(forecast_jobs, forecasts):
         if not forecast_df.empty:
             all_forecast_data.append(forecast_df)
 
@@ -345,11 +462,9 @@ def main():
             windows = find_optimal_windows(forecast_df)
             all_optimal_windows.extend(windows)
 
-            print(f"  ✅ Found {len(windows)} optimal windows")
+            print(f"  ✅ {site.name}: found {len(windows)} optimal windows")
         else:
-            print("  ⚠️  Could not generate forecast")
-
-        time.sleep(1)  # Respect API limits
+            print(f"  ⚠️  {site.name}: could not generate forecast")
 
     # Combine all data
     combined_historical = pd.concat(all_historical_data, ignore_index=True) if all_historical_data else pd.DataFrame()
@@ -1,3 +1,5 @@
+from collections import namedtuple
+
 merrimack_sites = {
     "01073500": {
         "name": "Merrimack River below Concord River at Lowell, MA",
@@ -40,3 +42,11 @@ merrimack_sites = {
         "difficulty": "Class I"
     }
 }
+
+Site = namedtuple('Site', [
+    'site_id', 'name', 'lat', 'lon',
+    'ideal_discharge_range', 'ideal_gage_range', 'difficulty'
+])
+
+# Flat, immutable view of merrimack_sites for the data pipeline
+sites = tuple(Site(site_id, **info) for site_id, info in merrimack_sites.items())
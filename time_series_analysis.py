@@ -1,8 +1,16 @@
 import numpy as np
 import pandas as pd
-from datetime import timedelta
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
+from concurrent.futures import ThreadPoolExecutor
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Hour of day and day of week take only 24 and 7 values, so their cyclic
+# encodings are looked up from these tables instead of recomputed per row
+_HOURS = np.arange(24)
+_DAYS = np.arange(7)
+_HOUR_SIN = np.sin(2 * np.pi * _HOURS / 24)
+_HOUR_COS = np.cos(2 * np.pi * _HOURS / 24)
+_DOW_SIN = np.sin(2 * np.pi * _DAYS / 7)
+_DOW_COS = np.cos(2 * np.pi * _DAYS / 7)
 
 def calculate_kayakability_score(discharge, gage_height, ideal_discharge_range, ideal_gage_range):
     """
@@ -59,6 +67,46 @@ def calculate_kayakability_score(discharge, gage_height, ideal_discharge_range,
     
     return round(min(100, max(0, total_score)))
 
+def calculate_kayakability_score_vec(discharge, gage_height, ideal_discharge_range, ideal_gage_range):
+    """
+    Vectorized calculate_kayakability_score over arrays of discharge and gage height.
+    Returns an integer array of scores from 0-100 (0 where either value is missing).
+    """
+    discharge = np.asarray(discharge, dtype=float)
+    gage_height = np.asarray(gage_height, dtype=float)
+    
+    # Extract ideal ranges
+    min_discharge, max_discharge = ideal_discharge_range
+    min_gage, max_gage = ideal_gage_range
+    
+    # Both branches are evaluated for every element, so silence the
+    # divisions that only matter for the branch np.where discards
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Discharge score (0-50 points), same decay as the scalar version
+        discharge_ok = (discharge >= min_discharge) & (discharge <= max_discharge)
+        discharge_ratio = np.where(discharge < min_discharge,
+                                   discharge / min_discharge, max_discharge / discharge)
+        discharge_score = np.where(discharge_ok, 50.0, 50 * discharge_ratio ** 2)
+        
+        # Gage height score (0-50 points)
+        gage_ok = (gage_height >= min_gage) & (gage_height <= max_gage)
+        gage_ratio = np.where(gage_height < min_gage,
+                              gage_height / min_gage, max_gage / gage_height)
+        gage_score = np.where(gage_ok, 50.0, 50 * gage_ratio ** 2)
+        
+        total_score = discharge_score + gage_score
+        
+        # Sweet-spot bonus where both values are in range
+        discharge_center = (min_discharge + max_discharge) / 2
+        gage_center = (min_gage + max_gage) / 2
+        discharge_proximity = 1 - np.abs(discharge - discharge_center) / (max_discharge - discharge_center)
+        gage_proximity = 1 - np.abs(gage_height - gage_center) / (max_gage - gage_center)
+        bonus = np.minimum(10, (discharge_proximity + gage_proximity) * 5)
+        total_score = np.where(discharge_ok & gage_ok, total_score + bonus, total_score)
+    
+    scores = np.round(np.clip(total_score, 0, 100))
+    return np.where(np.isnan(discharge) | np.isnan(gage_height), 0, scores).astype(int)
+
 def find_optimal_windows(forecast_df, min_score=60, min_duration=2):
     """
     Find optimal kayaking windows in the forecast data.
@@ -77,86 +125,93 @@ def find_optimal_windows(forecast_df, min_score=60, min_duration=2):
     df = forecast_df.sort_values('datetime').copy()
     df['datetime'] = pd.to_datetime(df['datetime'])
     
-    optimal_windows = []
+    # Lay each site's hours out contiguously (sites in order of first
+    # appearance), keeping every site's rows in datetime order
+    site_codes = pd.factorize(df['site_id'])[0]
+    order = np.argsort(site_codes, kind='stable')
+    df = df.iloc[order]
+    site_codes = site_codes[order]
     
-    # Group by site to find windows for each location
-    for site_id in df['site_id'].unique():
-        site_df = df[df['site_id'] == site_id].copy()
-        site_name = site_df['site_name'].iloc[0]
-        
-        # Find consecutive hours with good scores
-        good_conditions = site_df['kayakability_score'] >= min_score
-        
-        if not good_conditions.any():
-            continue
-        
-        # Find contiguous blocks of good conditions
-        blocks = []
-        current_block = []
-        
-        for idx, is_good in enumerate(good_conditions):
-            if is_good:
-                current_block.append(idx)
-            else:
-                if len(current_block) >= min_duration:
-                    blocks.append(current_block)
-                current_block = []
-        
-        # Don't forget the last block
-        if len(current_block) >= min_duration:
-            blocks.append(current_block)
-        
-        # Convert blocks to windows with metadata
-        for block in blocks:
-            if len(block) < min_duration:
-                continue
-                
-            start_idx = block[0]
-            end_idx = block[-1]
-            
-            window_data = site_df.iloc[start_idx:end_idx+1]
-            
-            window = {
-                'site_id': site_id,
-                'site_name': site_name,
-                'start_time': window_data['datetime'].iloc[0],
-                'end_time': window_data['datetime'].iloc[-1],
-                'duration_hours': len(block),
-                'avg_score': round(window_data['kayakability_score'].mean(), 1),
-                'max_score': window_data['kayakability_score'].max(),
-                'min_score': window_data['kayakability_score'].min(),
-                'avg_discharge': round(window_data['discharge_cfs'].mean(), 1),
-                'avg_gage': round(window_data['gage_height_ft'].mean(), 2),
-                'score_trend': 'stable'  # Could be enhanced to detect trends
-            }
-            
-            optimal_windows.append(window)
-    
-    # Sort by average score (best first), then by duration
-    optimal_windows.sort(key=lambda x: (x['avg_score'], x['duration_hours']), reverse=True)
-    
-    return optimal_windows
+    # Label contiguous blocks of good conditions; a block also ends at a site boundary
+    good = (df['kayakability_score'] >= min_score).to_numpy()
+    block_start = good & (~np.r_[False, good[:-1]] | np.r_[True, site_codes[1:] != site_codes[:-1]])
+    block_id = np.cumsum(block_start)
+    
+    # Summarize every block in one aggregation pass
+    windows = df[good].groupby(block_id[good], sort=False).agg(
+        site_id=('site_id', 'first'),
+        site_name=('site_name', 'first'),
+        start_time=('datetime', 'first'),
+        end_time=('datetime', 'last'),
+        duration_hours=('datetime', 'size'),
+        avg_score=('kayakability_score', 'mean'),
+        max_score=('kayakability_score', 'max'),
+        min_score=('kayakability_score', 'min'),
+        avg_discharge=('discharge_cfs', 'mean'),
+        avg_gage=('gage_height_ft', 'mean'),
+    )
+    windows = windows[windows['duration_hours'] >= min_duration]
+    windows = windows.round({'avg_score': 1, 'avg_discharge': 1, 'avg_gage': 2})
+    windows['score_trend'] = 'stable'  # Could be enhanced to detect trends
+    
+    # Sort by average score (best first), then by duration; lexsort is
+    # stable, so ties keep site/time order
+    order = np.lexsort((-windows['duration_hours'].to_numpy(), -windows['avg_score'].to_numpy()))
+    windows = windows.iloc[order]
+    
+    return windows.to_dict('records')
+
+def _lags(values, *periods):
+    """
+    Shift a 1-D array forward by each of periods, padding the front with NaN.
+    All lags are views into one NaN-padded copy of values.
+    """
+    pad = max(periods)
+    padded = np.concatenate([np.full(pad, np.nan), values])
+    return [padded[pad - p:pad - p + len(values)] for p in periods]
+
+def _centered_mean(values, window):
+    """Centered rolling mean, NaN where the window is incomplete (as pandas rolling(center=True))"""
+    means = np.full(len(values), np.nan)
+    if len(values) >= window:
+        start = window // 2
+        means[start:start + len(values) - window + 1] = sliding_window_view(values, window).mean(axis=1)
+    return means
 
 def create_time_features(df):
     """Create time-based features for forecasting"""
     df = df.copy()
-    df['hour'] = df['datetime'].dt.hour
-    df['day_of_week'] = df['datetime'].dt.dayofweek
-    df['day_of_year'] = df['datetime'].dt.dayofyear
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
-    df['day_sin'] = np.sin(2 * np.pi * df['day_of_week'] / 7)
-    df['day_cos'] = np.cos(2 * np.pi * df['day_of_week'] / 7)
-    df['discharge_lag1'] = df['discharge_cfs'].shift(1)
-    df['discharge_lag6'] = df['discharge_cfs'].shift(6)
-    df['gage_lag1'] = df['gage_height_ft'].shift(1)
-    df['gage_lag6'] = df['gage_height_ft'].shift(6)
-    df['discharge_ma6'] = df['discharge_cfs'].rolling(window=6, center=True).mean()
-    df['gage_ma6'] = df['gage_height_ft'].rolling(window=6, center=True).mean()
+    
+    # Read each calendar field once (local wall-clock time, so tz-aware
+    # timestamps keep their site-local hour) and work on the raw arrays
+    hours = df['datetime'].dt.hour.to_numpy()
+    days_of_week = df['datetime'].dt.dayofweek.to_numpy()
+    df['hour'] = hours
+    df['day_of_week'] = days_of_week
+    df['hour_sin'] = _HOUR_SIN[hours]
+    df['hour_cos'] = _HOUR_COS[hours]
+    df['day_sin'] = _DOW_SIN[days_of_week]
+    df['day_cos'] = _DOW_COS[days_of_week]
+    
+    # Lags and moving averages on the raw arrays, without intermediate Series
+    discharge = df['discharge_cfs'].to_numpy(dtype=float)
+    gage = df['gage_height_ft'].to_numpy(dtype=float)
+    df['discharge_lag1'], df['discharge_lag6'] = _lags(discharge, 1, 6)
+    df['gage_lag1'], df['gage_lag6'] = _lags(gage, 1, 6)
+    df['discharge_ma6'] = _centered_mean(discharge, 6)
+    df['gage_ma6'] = _centered_mean(gage, 6)
     return df
 
-def train_forecast_model(df, target_col='discharge_cfs'):
-    """Train a forecasting model for the given target column"""
+def train_forecast_models(df, target_cols=('discharge_cfs', 'gage_height_ft')):
+    """
+    Train one multi-output forecasting model for all target columns.
+    The features are built and scaled once, and LinearRegression solves
+    every target with a single least-squares fit.
+    """
+    # Imported here so runs that fail before training skip the sklearn/scipy import
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import StandardScaler
+    
     if len(df) < 24:
         return None, None
     
@@ -167,28 +222,56 @@ def train_forecast_model(df, target_col='discharge_cfs'):
         'gage_lag1', 'gage_lag6',
         'discharge_ma6', 'gage_ma6'
     ]
+    target_cols = list(target_cols)
     
-    df_clean = df_features.dropna(subset=feature_cols + [target_col])
+    df_clean = df_features.dropna(subset=feature_cols + target_cols)
     if len(df_clean) < 12:
         return None, None
     
     X = df_clean[feature_cols]
-    y = df_clean[target_col]
+    Y = df_clean[target_cols].to_numpy()
     
     scaler = StandardScaler()
     X_scaled = scaler.fit_transform(X)
     
     model = LinearRegression()
-    model.fit(X_scaled, y)
+    model.fit(X_scaled, Y)
     
     return model, scaler
 
-def forecast_conditions(site_id, site_info, csv_path, forecast_hours=240):
+def _linear_params(model, scaler):
     """
-    Generate forecast conditions for a site using historical data
+    Fold a fitted StandardScaler into its LinearRegression: since
+    w @ ((x - mean) / scale) + b == (w / scale) @ x + (b - w @ (mean / scale)),
+    return (weights, bias) that apply directly to unscaled features
     """
+    coef = model.coef_.T
+    weights = coef / scaler.scale_[:, None]
+    bias = model.intercept_ - scaler.mean_ @ weights
+    return weights, bias
+
+def _linear_recurrence(initial, transition, effects):
+    """
+    Run y[t] = y[t-1] @ transition + effects[t] from y[-1] = initial for a
+    2x2 transition. Plain float arithmetic beats NumPy's per-call overhead here.
+    """
+    (a, b), (c, d) = transition.tolist()
+    x, y = map(float, initial)
+    out = np.empty((len(effects), 2))
+    for i, (effect_x, effect_y) in enumerate(effects.tolist()):
+        x, y = x * a + y * c + effect_x, x * b + y * d + effect_y
+        out[i] = x, y
+    return out
+
+def forecast_conditions(site, csv_path, forecast_hours=240):
+    """
+    Generate forecast conditions for a site (a site_config.Site) using historical data
+    """
+    site_id = site.site_id
     try:
-        df = pd.read_csv(csv_path, parse_dates=['datetime'])
+        # Only these columns feed the model; skip parsing the rest
+        df = pd.read_csv(csv_path, usecols=['datetime', 'discharge_cfs', 'gage_height_ft'],
+                         parse_dates=['datetime'])
     except Exception as e:
         print(f"Error reading CSV {csv_path}: {e}")
         return pd.DataFrame()
@@ -196,73 +279,78 @@ def forecast_conditions(site_id, site_info, csv_path, forecast_hours=240):
     if df.empty:
         return pd.DataFrame()
     
-    # Train models for both discharge and gage height
-    discharge_model, discharge_scaler = train_forecast_model(df, 'discharge_cfs')
-    gage_model, gage_scaler = train_forecast_model(df, 'gage_height_ft')
+    # Train one model for both discharge and gage height
+    model, scaler = train_forecast_models(df)
     
-    if discharge_model is None or gage_model is None:
+    if model is None:
         print(f"Could not train models for site {site_id}")
         return pd.DataFrame()
     
-    # Generate future timestamps
+    # The recursion below runs on these arrays instead of calling sklearn every hour
+    weights, bias = _linear_params(model, scaler)
+    
+    # Generate future timestamps and their time features in one pass
     last_time = df['datetime'].max()
-    future_times = [last_time + timedelta(hours=i) for i in range(1, forecast_hours + 1)]
-    
-    forecast_data = []
-    latest_discharge = df['discharge_cfs'].iloc[-1]
-    latest_gage = df['gage_height_ft'].iloc[-1]
-    
-    for future_time in future_times:
-        # Create time features
-        hour = future_time.hour
-        day_of_week = future_time.dayofweek
-        hour_sin = np.sin(2 * np.pi * hour / 24)
-        hour_cos = np.cos(2 * np.pi * hour / 24)
-        day_sin = np.sin(2 * np.pi * day_of_week / 7)
-        day_cos = np.cos(2 * np.pi * day_of_week / 7)
-        
-        # Use latest values for lag features (simplified)
-        features = np.array([[hour_sin, hour_cos, day_sin, day_cos,
-                              latest_discharge, latest_discharge,
-                              latest_gage, latest_gage,
-                              latest_discharge, latest_gage]])
-        
-        # Make predictions
-        try:
-            discharge_pred = discharge_model.predict(discharge_scaler.transform(features))[0]
-            gage_pred = gage_model.predict(gage_scaler.transform(features))[0]
-        except Exception as e:
-            print(f"Prediction error for {future_time}: {e}")
-            continue
-        
-        # Calculate kayakability score
-        kayak_score = calculate_kayakability_score(
-            discharge_pred, gage_pred,
-            site_info['ideal_discharge_range'],
-            site_info['ideal_gage_range']
-        )
-        
-        forecast_data.append({
-            'site_id': site_id,
-            'site_name': site_info['name'],
-            'datetime': future_time,
-            'discharge_cfs': round(discharge_pred, 1),
-            'gage_height_ft': round(gage_pred, 2),
-            'kayakability_score': kayak_score,
-            'forecast_type': 'predicted'
-        })
-        
-        # Update latest values for next iteration
-        latest_discharge = discharge_pred
-        latest_gage = gage_pred
+    future_times = pd.date_range(last_time + pd.Timedelta(hours=1), periods=forecast_hours, freq='h')
+    hours = future_times.hour.to_numpy()
+    days_of_week = future_times.dayofweek.to_numpy()
+    
+    # The time features are known up front, so their contribution to every
+    # hour's prediction comes from one matrix product over the whole horizon
+    time_features = np.column_stack([
+        _HOUR_SIN[hours], _HOUR_COS[hours],
+        _DOW_SIN[days_of_week], _DOW_COS[days_of_week]
+    ])
+    time_effect = time_features @ weights[:4] + bias
+    
+    # The lag features are just the previous (discharge, gage) repeated, so
+    # their contribution folds into a 2x2 transition:
+    # [d, d, g, g, d, g] = [d, g] @ lag_selector
+    lag_selector = np.array([[1, 1, 0, 0, 1, 0],
+                             [0, 0, 1, 1, 0, 1]])
+    transition = lag_selector @ weights[4:]
     
-    return pd.DataFrame(forecast_data)
+    # Use latest values for lag features (simplified), feeding each
+    # prediction into the next hour
+    latest = (df['discharge_cfs'].iloc[-1], df['gage_height_ft'].iloc[-1])
+    predictions = _linear_recurrence(latest, transition, time_effect)
+    
+    discharge_pred = predictions[:, 0]
+    gage_pred = predictions[:, 1]
+    
+    # Score the whole horizon at once
+    kayak_scores = calculate_kayakability_score_vec(
+        discharge_pred, gage_pred,
+        site.ideal_discharge_range,
+        site.ideal_gage_range
+    )
+    
+    return pd.DataFrame({
+        'site_id': site_id,
+        'site_name': site.name,
+        'datetime': future_times,
+        'discharge_cfs': discharge_pred.round(1),
+        'gage_height_ft': gage_pred.round(2),
+        'kayakability_score': kayak_scores,
+        'forecast_type': 'predicted'
+    })
+
+def forecast_all_sites(site_csv_paths, max_workers=None):
+    """
+    Run forecast_conditions for each (site, csv_path) pair concurrently.
+    Sites are independent and the heavy steps (CSV parsing, lstsq) release
+    the GIL, so threads overlap them. Returns forecasts in input order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda job: forecast_conditions(*job), site_csv_paths))
 
 # Export all functions
 __all__ = [
     "calculate_kayakability_score",
+    "calculate_kayakability_score_vec",
     "find_optimal_windows", 
     "create_time_features",
-    "train_forecast_model",
-    "forecast_conditions"
+    "train_forecast_models",
+    "forecast_conditions",
+    "forecast_all_sites"
 ]